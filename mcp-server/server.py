@@ -1,8 +1,14 @@
 from mcp.server.fastmcp import FastMCP
 import os
-import json
+import asyncio
+import functools
+import io
+import re
 import uuid
+import threading
+from typing import Any, Awaitable, Callable
 import kuzu
+import orjson
 import shutil
 
 # Initialize FastMCP
@@ -11,17 +17,187 @@ mcp = FastMCP("PersonalCRM-Kuzu", host="0.0.0.0")
 # Database Path
 DB_PATH = os.getenv("KUZU_PATH", "/app/kuzu_data/personal_crm_db")
 
-# Initialize KuzuDB
-
+# Maximum number of rows run_cypher returns
+MAX_CYPHER_ROWS = 10_000
 
-def get_db():
-    return kuzu.Database(DB_PATH)
+TRANSACTION_CONTROL_ERROR = (
+    "Error: transaction statements (BEGIN/COMMIT/ROLLBACK) are not allowed; "
+    "use add_persons_bulk/add_facts_bulk for multi-statement writes."
+)
 
-
-def get_conn(db=None):
-    if db is None:
-        db = get_db()
-    return kuzu.Connection(db)
+# Initialize KuzuDB
+# Opening a Database/Connection is far more expensive than the queries the tools
+# run, so a single handle of each is shared across all tool calls.
+_DB = None
+_CONN = None
+_TXN_CONN = None
+_LOCK = threading.Lock()
+
+# Tools run in worker threads; writes are serialized so explicit transactions
+# and the write-invalidated caches below never interleave
+_WRITE_LOCK = threading.Lock()
+
+# Catalog of relationship tables, loaded once from SHOW_TABLES and kept up to date
+# by ensure_rel_table, so add_fact skips the DDL and list_relation_types skips
+# the catalog scan
+_REL_TYPES: set[str] = set()
+_REL_TYPES_LOADED = False
+_REL_TYPES_GENERATION = 0
+
+# Whether Person is keyed on name. Databases created before that change keep a
+# uuid-keyed table, so duplicate names have to be checked with a query there.
+_PERSON_NAME_IS_KEY = False
+
+# Characters stripped from relationship type names (anything but letters, digits, _)
+_NON_IDENTIFIER_CHARS = re.compile(r"\W")
+
+# Transaction control in raw queries would leave the shared connection inside a
+# manual transaction that every later tool call runs in
+_TRANSACTION_CONTROL = re.compile(
+    r"(^|;)\s*(BEGIN|COMMIT|ROLLBACK)\b", re.IGNORECASE
+)
+
+# Raw queries that may change the catalog (tables, their columns, attached
+# databases); only these invalidate the table catalog and prepared statements
+_SCHEMA_CHANGE = re.compile(
+    r"\b(TABLE|DROP|ALTER|RENAME|ATTACH|DETACH|IMPORT)\b", re.IGNORECASE
+)
+
+# Results of the read-only tools, keyed by (tool, args, epoch). Writes bump the
+# epoch, so stale entries are never hit again and age out of the capped dict.
+_READ_CACHE: dict = {}
+_READ_CACHE_SIZE = 128
+_EPOCH = 0
+_RULE_EPOCH = 0
+
+# Prepared statements keyed by (connection, query), so repeated queries skip
+# Kuzu's parser and planner
+_STATEMENTS: dict = {}
+_STATEMENTS_SIZE = 128
+_STATEMENTS_GENERATION = 0
+
+
+def get_db() -> kuzu.Database:
+    global _DB
+    with _LOCK:
+        if _DB is None:
+            _DB = kuzu.Database(DB_PATH)
+    return _DB
+
+
+def get_conn(db: kuzu.Database | None = None) -> kuzu.Connection:
+    global _CONN
+    if db is not None:
+        return kuzu.Connection(db)
+    db = get_db()
+    with _LOCK:
+        if _CONN is None:
+            _CONN = kuzu.Connection(db)
+    return _CONN
+
+
+def get_txn_conn() -> kuzu.Connection:
+    """Connection reserved for explicit transactions, so concurrent reads on the
+    shared connection never run inside them. Callers must hold _WRITE_LOCK."""
+    global _TXN_CONN
+    if _TXN_CONN is None:
+        _TXN_CONN = kuzu.Connection(get_db())
+    return _TXN_CONN
+
+
+def threaded_tool(
+    writes: bool = False,
+) -> Callable[[Callable[..., str]], Callable[..., Awaitable[str]]]:
+    """Turn a blocking tool into an async one that runs in a worker thread, so
+    Kuzu calls don't block the event loop. Write tools run one at a time."""
+
+    def decorator(fn: Callable[..., str]) -> Callable[..., Awaitable[str]]:
+        def run(*args: Any, **kwargs: Any) -> str:
+            if not writes:
+                return fn(*args, **kwargs)
+            with _WRITE_LOCK:
+                return fn(*args, **kwargs)
+
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> str:
+            return await asyncio.to_thread(run, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def prepare_statement(conn: kuzu.Connection, query: str) -> kuzu.PreparedStatement:
+    """Return a prepared statement for query on conn, preparing it on first use."""
+    key = (conn, query)
+    stmt = _STATEMENTS.get(key)
+    if stmt is None:
+        generation = _STATEMENTS_GENERATION
+        stmt = conn.prepare(query)
+        if not stmt.is_success():
+            raise RuntimeError(stmt.get_error_message())
+        with _LOCK:
+            # Don't cache a plan if the catalog changed while it was prepared
+            if generation == _STATEMENTS_GENERATION:
+                if len(_STATEMENTS) >= _STATEMENTS_SIZE:
+                    del _STATEMENTS[next(iter(_STATEMENTS))]
+                _STATEMENTS[key] = stmt
+    return stmt
+
+
+def clear_statements() -> None:
+    """Drop all prepared statements; plans prepared against an old catalog must
+    not be reused after DDL."""
+    global _STATEMENTS_GENERATION
+    with _LOCK:
+        _STATEMENTS.clear()
+        _STATEMENTS_GENERATION += 1
+
+
+def cache_read(key: tuple, value: str) -> str:
+    """Store a read-only tool result, evicting the oldest entry when full."""
+    with _LOCK:
+        if len(_READ_CACHE) >= _READ_CACHE_SIZE:
+            del _READ_CACHE[next(iter(_READ_CACHE))]
+        _READ_CACHE[key] = value
+    return value
+
+
+def invalidate_reads(data: bool = True, rules: bool = False) -> None:
+    """Invalidate cached reads of people/facts and/or rules after a write."""
+    global _EPOCH, _RULE_EPOCH
+    if data:
+        _EPOCH += 1
+    if rules:
+        _RULE_EPOCH += 1
+
+
+def forget_raw_query_effects(query: str) -> None:
+    """Drop every cache a raw query may have made stale, including through DDL.
+    Called after the query has run, so a concurrent read can't cache its
+    pre-commit state under the new epoch or catalog."""
+    invalidate_reads(data=True, rules=True)
+    if _SCHEMA_CHANGE.search(query):
+        forget_rel_types()
+        clear_statements()
+
+
+def format_rows(result: kuzu.QueryResult) -> str:
+    """Format query result rows one per line, capped at MAX_CYPHER_ROWS."""
+    # Stream rows into a buffer, capped so huge results are neither fully
+    # materialized nor sent back to the client
+    buf = io.StringIO()
+    count = 0
+    while result.has_next() and count < MAX_CYPHER_ROWS:
+        if count:
+            buf.write("\n")
+        buf.write(str(result.get_next()))
+        count += 1
+    if not count:
+        return "No results."
+    if result.has_next():
+        buf.write(f"\n... truncated after {MAX_CYPHER_ROWS} rows.")
+    return buf.getvalue()
 
 
 def get_schema_info(conn):
@@ -41,18 +217,21 @@ def get_schema_info(conn):
 
 def initialize_schema():
     """Initialize the KuzuDB schema for Person, Rules, and base structures."""
+    global _PERSON_NAME_IS_KEY
     db_dir = os.path.dirname(DB_PATH)
     if db_dir and not os.path.exists(db_dir):
         os.makedirs(db_dir, exist_ok=True)
 
-    db = get_db()
-    conn = kuzu.Connection(db)
+    conn = get_conn()
 
     # Kuzu doesn't support IF NOT EXISTS for tables in all versions.
     # We try to create and catch error if exists.
+    # Names are the primary key so the engine enforces uniqueness (and indexes
+    # lookups by name) instead of add_person probing for duplicates.
     try:
         conn.execute(
-            "CREATE NODE TABLE Person(uuid STRING, name STRING, data STRING, PRIMARY KEY (uuid))"
+            "CREATE NODE TABLE Person(name STRING, uuid STRING, data STRING, "
+            "PRIMARY KEY (name))"
         )
         print("Initialized Person table.")
     except RuntimeError as e:
@@ -61,6 +240,13 @@ def initialize_schema():
         else:
             print(f"Note: Person table creation skipped/failed: {e}")
 
+    _PERSON_NAME_IS_KEY = person_name_is_key(conn)
+    if not _PERSON_NAME_IS_KEY:
+        print(
+            "Note: Person table is not keyed on name; checking duplicate names "
+            "with a lookup. Recreate the database to use the name key."
+        )
+
     try:
         conn.execute(
             "CREATE NODE TABLE Rule(name STRING, cypher STRING, description STRING, PRIMARY KEY (name))"
@@ -72,28 +258,172 @@ def initialize_schema():
         else:
             print(f"Note: Rule table creation skipped/failed: {e}")
 
+    load_rel_types(conn)
 
-def ensure_rel_table(conn, rel_type: str):
-    """Ensure a relationship table exists."""
-    safe_type = "".join(c for c in rel_type if c.isalnum() or c == "_")
+
+def person_name_is_key(conn: kuzu.Connection) -> bool:
+    """Check whether the Person table's primary key is the name column."""
+    try:
+        df = conn.execute("CALL TABLE_INFO('Person') RETURN *").get_as_df()
+    except RuntimeError as e:
+        print(f"Note: could not read Person table info: {e}")
+        return False
+    key = df[df["primary key"].astype(bool)]["name"].tolist()
+    return key == ["name"]
+
+
+def person_names_taken(conn: kuzu.Connection, names: list[str]) -> list[str]:
+    """Return which of names already belong to a person, sorted."""
+    res = conn.execute(
+        prepare_statement(
+            conn, "MATCH (p:Person) WHERE p.name IN $names RETURN p.name"
+        ),
+        {"names": names},
+    )
+    taken = set()
+    while res.has_next():
+        taken.add(res.get_next()[0])
+    return sorted(taken)
+
+
+def load_rel_types(conn: kuzu.Connection) -> set[str]:
+    """Return the relationship table catalog, reading it from Kuzu if not loaded."""
+    global _REL_TYPES_LOADED
+    if _REL_TYPES_LOADED:
+        return _REL_TYPES
+    generation = _REL_TYPES_GENERATION
+    # Use SHOW TABLES since db.schema() is deprecated/removed in newer Kuzu versions
+    df = conn.execute("CALL SHOW_TABLES() RETURN *").get_as_df()
+    # Columns include name and type; relationship tables have type='REL'
+    rel_types = set(df[df["type"] == "REL"]["name"].tolist())
+    with _LOCK:
+        # A raw query may have changed the catalog while it was being read; then
+        # answer from this read but leave the catalog to be reloaded
+        if generation != _REL_TYPES_GENERATION:
+            return rel_types
+        _REL_TYPES.update(rel_types)
+        _REL_TYPES_LOADED = True
+    return _REL_TYPES
+
+
+def forget_rel_types() -> None:
+    """Drop the relationship table catalog so it is reloaded on next use."""
+    global _REL_TYPES_LOADED, _REL_TYPES_GENERATION
+    with _LOCK:
+        _REL_TYPES.clear()
+        _REL_TYPES_LOADED = False
+        _REL_TYPES_GENERATION += 1
+
+
+def is_duplicate_key_error(error: Exception) -> bool:
+    """Check whether a Kuzu error reports a primary key violation."""
+    message = str(error).lower()
+    return "duplicated primary key" in message or "already exists" in message
+
+
+def sanitize_rel_type(rel_type: str) -> str:
+    """Strip a relationship type down to a valid table name."""
+    safe_type = _NON_IDENTIFIER_CHARS.sub("", rel_type)
     if not safe_type:
         raise ValueError("Invalid relationship type")
+    return safe_type
+
+
+def ensure_rel_table(conn: kuzu.Connection, rel_type: str) -> str:
+    """Ensure a relationship table exists."""
+    safe_type = sanitize_rel_type(rel_type)
+    if safe_type in _REL_TYPES:
+        return safe_type
 
     try:
         conn.execute(
             f"CREATE REL TABLE {safe_type}(FROM Person TO Person, data STRING)"
         )
-        print(f"Created relationship table {safe_type}")
     except RuntimeError as e:
-        if "already exists" in str(e):
-            pass
-        else:
+        if "already exists" not in str(e):
             # If it fails for another reason, raise
             raise e
+        # The name may belong to a node table, which can't hold facts; check
+        # against a fresh catalog rather than trusting the error
+        forget_rel_types()
+        if safe_type not in load_rel_types(conn):
+            raise ValueError(f"{safe_type} is not a relationship table")
+        return safe_type
+    print(f"Created relationship table {safe_type}")
+    clear_statements()
+    _REL_TYPES.add(safe_type)
     return safe_type
 
 
+def looks_like_json_container(text: str) -> bool:
+    """Cheap prescreen: text starts and ends like a JSON object or array."""
+    text = text.strip()
+    return bool(text) and text[0] in "{[" and text[-1] in "}]"
+
+
+def decode_stored_data(data: str | None) -> Any:
+    """Decode a stored data column for output. Data that is not a JSON object or
+    array (e.g. written through add_person_fast or run_cypher) stays a string."""
+    if not data:
+        return {}
+    try:
+        value = orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return data
+    return value if isinstance(value, (dict, list)) else data
+
+
+def is_valid_properties(properties: str) -> bool:
+    """Check that properties is a JSON object or array, parsing only when needed."""
+    # The common empty case needs no parser, and anything that does not start
+    # and end like an object/array can be rejected without one
+    if properties in ("{}", "[]"):
+        return True
+    if not looks_like_json_container(properties):
+        return False
+    try:
+        orjson.loads(properties)
+    except orjson.JSONDecodeError:
+        return False
+    return True
+
+
+def rollback(conn: kuzu.Connection) -> None:
+    """Roll back the open transaction on conn, tolerating one Kuzu already aborted."""
+    try:
+        conn.execute("ROLLBACK")
+    except Exception as e:
+        # Kuzu aborts the transaction itself when a statement in it fails
+        if "no active transaction" not in str(e).lower():
+            print(f"Note: rollback failed: {e}")
+
+
+def parse_bulk_items(items_json: str, required_keys: tuple[str, ...]) -> list[dict]:
+    """Parse a JSON array of objects for the bulk tools; ValueError if malformed."""
+    items = orjson.loads(items_json)
+    if not isinstance(items, list):
+        raise ValueError("expected a JSON array")
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or any(
+            not isinstance(item.get(k), str) for k in required_keys
+        ):
+            keys = ", ".join(required_keys)
+            raise ValueError(f"item {i} must be an object with string {keys}")
+        # Properties may be inline or a JSON string; they are stored as a string
+        props = item.get("properties", {})
+        if isinstance(props, str):
+            if not is_valid_properties(props):
+                raise ValueError(f"item {i} properties must be a JSON object or array")
+        elif isinstance(props, (dict, list)):
+            props = orjson.dumps(props).decode()
+        else:
+            raise ValueError(f"item {i} properties must be a JSON object or array")
+        item["properties"] = props
+    return items
+
+
 @mcp.tool()
+@threaded_tool(writes=True)
 def add_person(name: str, properties: str = "{}") -> str:
     """
     Add a new person with arbitrary properties.
@@ -101,27 +431,52 @@ def add_person(name: str, properties: str = "{}") -> str:
         name: Name of the person.
         properties: JSON string of properties (e.g., '{"gender": "M", "job": "Engineer"}')
     """
-    try:
-        props = json.loads(properties)
-    except json.JSONDecodeError:
+    if not is_valid_properties(properties):
         return "Error: properties must be a valid JSON string."
+    return create_person(name, properties)
 
+
+@mcp.tool()
+@threaded_tool(writes=True)
+def add_person_fast(name: str, properties_prevalidated: str = "{}") -> str:
+    """
+    Add a new person without fully parsing the properties JSON.
+    Only use this when the properties are known to be a valid JSON object.
+    Args:
+        name: Name of the person.
+        properties_prevalidated: JSON string of properties, already validated.
+    """
+    if not looks_like_json_container(properties_prevalidated):
+        return "Error: properties must be a JSON object or array."
+    return create_person(name, properties_prevalidated)
+
+
+def create_person(name: str, properties: str) -> str:
+    """Insert a person whose properties JSON has already been checked."""
     pid = str(uuid.uuid4())
     conn = get_conn()
 
-    # Check if name exists (enforce unique name for this POC)
-    res = conn.execute("MATCH (p:Person) WHERE p.name = $name RETURN p", {"name": name})
-    if res.has_next():
+    # Name uniqueness is enforced by the Person primary key, or by a lookup on
+    # databases whose Person table predates it
+    if not _PERSON_NAME_IS_KEY and person_names_taken(conn, [name]):
         return f"Error: Person with name '{name}' already exists."
-
-    conn.execute(
-        "CREATE (p:Person {uuid: $uuid, name: $name, data: $data})",
-        {"uuid": pid, "name": name, "data": properties},
-    )
+    try:
+        conn.execute(
+            prepare_statement(
+                conn, "CREATE (p:Person {uuid: $uuid, name: $name, data: $data})"
+            ),
+            {"uuid": pid, "name": name, "data": properties},
+        )
+    except RuntimeError as e:
+        if is_duplicate_key_error(e):
+            return f"Error: Person with name '{name}' already exists."
+        raise e
+    invalidate_reads()
     return f"Added person: {name} ({pid})"
 
 
 @mcp.tool()
+@threaded_tool(writes=True)
 def add_fact(from_name: str, to_name: str, type: str, properties: str = "{}") -> str:
     """
     Add a relationship/fact between two people.
@@ -131,9 +486,7 @@ def add_fact(from_name: str, to_name: str, type: str, properties: str = "{}") ->
         type: Type of relation (e.g., 'parent_child', 'spouse', 'met_at').
         properties: JSON string of details.
     """
-    try:
-        json.loads(properties)
-    except json.JSONDecodeError:
+    if not is_valid_properties(properties):
         return "Error: properties must be a valid JSON string."
 
     conn = get_conn()
@@ -142,29 +495,145 @@ def add_fact(from_name: str, to_name: str, type: str, properties: str = "{}") ->
     except ValueError:
         return "Error: Invalid relationship type name."
 
-    # Check existence
-    res_from = conn.execute(
-        "MATCH (p:Person) WHERE p.name = $name RETURN p.uuid", {"name": from_name}
+    # Create relationship. The MATCH only yields a row when both people exist,
+    # so an empty result means nothing was created.
+    query = (
+        "MATCH (a:Person {name: $from_name}), (b:Person {name: $to_name}) "
+        f"CREATE (a)-[:{safe_type} {{data: $data}}]->(b) RETURN a.name"
     )
-    if not res_from.has_next():
-        return f"Error: Person '{from_name}' not found."
-
-    res_to = conn.execute(
-        "MATCH (p:Person) WHERE p.name = $name RETURN p.uuid", {"name": to_name}
+    res = conn.execute(
+        prepare_statement(conn, query),
+        {"from_name": from_name, "to_name": to_name, "data": properties},
     )
-    if not res_to.has_next():
-        return f"Error: Person '{to_name}' not found."
+    if not res.has_next():
+        # Error path only: find out which side is missing
+        found = conn.execute(
+            prepare_statement(
+                conn,
+                "MATCH (p:Person) WHERE p.name IN [$from_name, $to_name] RETURN p.name",
+            ),
+            {"from_name": from_name, "to_name": to_name},
+        )
+        names = set()
+        while found.has_next():
+            names.add(found.get_next()[0])
+        missing = from_name if from_name not in names else to_name
+        return f"Error: Person '{missing}' not found."
+    invalidate_reads()
+
+    return f"Added fact: {from_name} --[{safe_type}]--> {to_name}"
 
-    # Create relationship
-    query = f"MATCH (a:Person {{name: $from_name}}), (b:Person {{name: $to_name}}) CREATE (a)-[:{safe_type} {{data: $data}}]->(b)"
-    conn.execute(
-        query, {"from_name": from_name, "to_name": to_name, "data": properties}
+
+@mcp.tool()
+@threaded_tool(writes=True)
+def add_persons_bulk(people_json: str) -> str:
+    """
+    Add many people in a single transaction.
+    Args:
+        people_json: JSON array of objects with "name" and optional "properties"
+            (e.g., '[{"name": "Alice", "properties": {"job": "Engineer"}}]')
+    """
+    try:
+        people = parse_bulk_items(people_json, ("name",))
+    except ValueError as e:
+        return f"Error: people_json must be a JSON array of people ({e})."
+
+    conn = get_txn_conn()
+    if not _PERSON_NAME_IS_KEY:
+        names = [person["name"] for person in people]
+        taken = person_names_taken(conn, names)
+        if len(set(names)) != len(names) or taken:
+            return (
+                "Error: duplicate person name in batch, nothing added "
+                f"(already exists: {', '.join(taken) or 'none'})."
+            )
+
+    # One explicit transaction commits (and syncs the WAL) once for the whole batch
+    create_stmt = prepare_statement(
+        conn, "CREATE (p:Person {uuid: $uuid, name: $name, data: $data})"
     )
+    try:
+        conn.execute("BEGIN TRANSACTION")
+        for person in people:
+            conn.execute(
+                create_stmt,
+                {
+                    "uuid": str(uuid.uuid4()),
+                    "name": person["name"],
+                    "data": person["properties"],
+                },
+            )
+        conn.execute("COMMIT")
+    except Exception as e:
+        rollback(conn)
+        if is_duplicate_key_error(e):
+            return f"Error: duplicate person name in batch, nothing added ({e})."
+        return f"Error adding people, nothing added: {e}"
+    invalidate_reads()
+    return f"Added {len(people)} people."
 
-    return f"Added fact: {from_name} --[{safe_type}]--> {to_name}"
+
+@mcp.tool()
+@threaded_tool(writes=True)
+def add_facts_bulk(facts_json: str) -> str:
+    """
+    Add many relationships/facts in a single transaction.
+    Args:
+        facts_json: JSON array of objects with "from_name", "to_name", "type" and
+            optional "properties" (same meaning as the add_fact arguments).
+    """
+    try:
+        facts = parse_bulk_items(facts_json, ("from_name", "to_name", "type"))
+    except ValueError as e:
+        return f"Error: facts_json must be a JSON array of facts ({e})."
+
+    try:
+        for fact in facts:
+            fact["type"] = sanitize_rel_type(fact["type"])
+    except ValueError:
+        return "Error: Invalid relationship type name."
+
+    conn = get_txn_conn()
+    names = list({f["from_name"] for f in facts} | {f["to_name"] for f in facts})
+    missing = sorted(set(names) - set(person_names_taken(conn, names)))
+    if missing:
+        return f"Error: Person(s) not found: {', '.join(missing)}."
+
+    # Relationship tables are DDL, so create them before opening the transaction,
+    # and only once the batch is known to be valid
+    try:
+        for rel_type in {f["type"] for f in facts}:
+            ensure_rel_table(conn, rel_type)
+    except ValueError:
+        return "Error: Invalid relationship type name."
+    except RuntimeError as e:
+        return f"Error creating relationship type, nothing added: {e}"
+
+    try:
+        conn.execute("BEGIN TRANSACTION")
+        for fact in facts:
+            query = (
+                "MATCH (a:Person {name: $from_name}), (b:Person {name: $to_name}) "
+                f"CREATE (a)-[:{fact['type']} {{data: $data}}]->(b)"
+            )
+            conn.execute(
+                prepare_statement(conn, query),
+                {
+                    "from_name": fact["from_name"],
+                    "to_name": fact["to_name"],
+                    "data": fact["properties"],
+                },
+            )
+        conn.execute("COMMIT")
+    except Exception as e:
+        rollback(conn)
+        return f"Error adding facts, nothing added: {e}"
+    invalidate_reads()
+    return f"Added {len(facts)} facts."
 
 
 @mcp.tool()
+@threaded_tool(writes=True)
 def add_rule(name: str, cypher_query: str, description: str = "") -> str:
     """
     Save a reusable Cypher query/rule.
@@ -174,121 +643,151 @@ def add_rule(name: str, cypher_query: str, description: str = "") -> str:
         description: Optional description.
     """
     conn = get_conn()
-    # Manual upsert to avoid KuzuDB parser issues with map parameters in CREATE/MERGE clauses
     try:
-        # Escape single quotes for manual string construction
-        safe_cypher = cypher_query.replace("'", "\\'")
-        safe_desc = description.replace("'", "\\'")
-
-        # Check if rule exists
+        # Check if rule exists, only to report whether it was created or updated
         check = conn.execute(
-            "MATCH (r:Rule) WHERE r.name = $name RETURN r.name", {"name": name}
+            prepare_statement(
+                conn, "MATCH (r:Rule) WHERE r.name = $name RETURN r.name"
+            ),
+            {"name": name},
         )
+        existed = check.has_next()
 
-        if check.has_next():
-            # Update
-            # We use f-string interpolation because binding parameters in SET clauses combined with other things
-            # has shown instability in this specific version/setup.
-            conn.execute(
-                f"MATCH (r:Rule) WHERE r.name = '{name}' SET r.cypher = '{safe_cypher}', r.description = '{safe_desc}'"
-            )
-            return f"Rule '{name}' updated."
-        else:
-            # Create
-            # We explicitly avoid using parameters for the map properties here to bypass the "expected rule oC_SingleQuery" error
-            conn.execute(
-                f"CREATE (r:Rule {{name: '{name}', cypher: '{safe_cypher}', description: '{safe_desc}'}})"
-            )
-            return f"Rule '{name}' created."
+        # Upsert with parameters so rule text is never spliced into the query
+        conn.execute(
+            prepare_statement(
+                conn,
+                "MERGE (r:Rule {name: $name}) "
+                "SET r.cypher = $cypher, r.description = $description",
+            ),
+            {"name": name, "cypher": cypher_query, "description": description},
+        )
+        invalidate_reads(data=False, rules=True)
+        return f"Rule '{name}' updated." if existed else f"Rule '{name}' created."
     except Exception as e:
         return f"Error saving rule: {e}"
 
 
 @mcp.tool()
+@threaded_tool()
 def get_rule(name: str) -> str:
     """Retrieve a stored rule's Cypher query."""
+    key = ("get_rule", (name,), _RULE_EPOCH)
+    if key in _READ_CACHE:
+        return _READ_CACHE[key]
+
     conn = get_conn()
     res = conn.execute(
-        "MATCH (r:Rule) WHERE r.name = $name RETURN r.cypher, r.description",
+        prepare_statement(
+            conn, "MATCH (r:Rule) WHERE r.name = $name RETURN r.cypher, r.description"
+        ),
         {"name": name},
     )
     if res.has_next():
         row = res.get_next()
-        return f"Rule: {name}\nDescription: {row[1]}\nCypher: {row[0]}"
-    return "Rule not found."
+        return cache_read(
+            key, f"Rule: {name}\nDescription: {row[1]}\nCypher: {row[0]}"
+        )
+    return cache_read(key, "Rule not found.")
 
 
 @mcp.tool()
+@threaded_tool()
 def list_rules() -> str:
     """List all stored rules."""
+    key = ("list_rules", (), _RULE_EPOCH)
+    if key in _READ_CACHE:
+        return _READ_CACHE[key]
+
     conn = get_conn()
-    res = conn.execute("MATCH (r:Rule) RETURN r.name, r.description")
-    rules = []
-    while res.has_next():
-        row = res.get_next()
-        # Kuzu row might be list or dict depending on driver version.
-        # Assuming list for now based on older docs, but let's be safe.
-        r_name = row[0] if isinstance(row, list) else row["r.name"]
-        r_desc = row[1] if isinstance(row, list) else row["r.description"]
-        rules.append(f"- {r_name}: {r_desc}")
-    return "\n".join(rules) if rules else "No rules found."
+    df = conn.execute(
+        "MATCH (r:Rule) RETURN r.name AS name, r.description AS description"
+    ).get_as_df()
+    # Convert whole columns at once instead of walking the frame row by row
+    names, descs = df["name"].tolist(), df["description"].tolist()
+    rules = "\n".join(f"- {n}: {d}" for n, d in zip(names, descs))
+    return cache_read(key, rules or "No rules found.")
 
 
 @mcp.tool()
+@threaded_tool(writes=True)
 def run_cypher(query: str) -> str:
     """
     Execute a raw Cypher query.
     Args:
         query: Cypher query string.
     """
+    if _TRANSACTION_CONTROL.search(query):
+        return TRANSACTION_CONTROL_ERROR
     conn = get_conn()
     try:
-        result = conn.execute(query)
-        rows = []
-        while result.has_next():
-            row = result.get_next()
-            rows.append(str(row))
-        return "\n".join(rows) if rows else "No results."
+        return format_rows(conn.execute(query))
     except Exception as e:
         return f"Error executing query: {str(e)}"
+    finally:
+        forget_raw_query_effects(query)
 
 
 @mcp.tool()
-def list_relation_types() -> str:
-    """List all relationship types (Edge Tables)."""
+@threaded_tool(writes=True)
+def run_cypher_prepared(query: str, params_json: str = "{}") -> str:
+    """
+    Execute a parameterized Cypher query, reusing its prepared plan across calls.
+    Pass values through parameters instead of formatting them into the query.
+    Args:
+        query: Cypher query string using parameters
+            (e.g., 'MATCH (p:Person) WHERE p.name = $name RETURN p.data').
+        params_json: JSON object of parameter values (e.g., '{"name": "Alice"}').
+    """
+    try:
+        params = orjson.loads(params_json)
+    except orjson.JSONDecodeError:
+        return "Error: params_json must be a valid JSON string."
+    if not isinstance(params, dict):
+        return "Error: params_json must be a JSON object."
+    if _TRANSACTION_CONTROL.search(query):
+        return TRANSACTION_CONTROL_ERROR
+
     conn = get_conn()
     try:
-        # Use SHOW TABLES since db.schema() is deprecated/removed in newer Kuzu versions
-        result = conn.execute("CALL SHOW_TABLES() RETURN *")
-        tables = []
-        while result.has_next():
-            row = result.get_next()
-            # row format: [id, name, type, storage, options] or similar depending on version
-            # We want to filter for type='REL'
-            # Let's inspect the row structure based on previous manual query result:
-            # [3, 'created', 'REL', 'local(kuzu)', '']
-            if isinstance(row, list) and len(row) >= 3:
-                if row[2] == "REL":
-                    tables.append(row[1])
-            elif isinstance(row, dict) and row.get("type") == "REL":
-                tables.append(row.get("name"))
+        return format_rows(conn.execute(prepare_statement(conn, query), params))
+    except Exception as e:
+        return f"Error executing query: {str(e)}"
+    finally:
+        forget_raw_query_effects(query)
+
 
+@mcp.tool()
+@threaded_tool()
+def list_relation_types() -> str:
+    """List all relationship types (Edge Tables)."""
+    try:
+        tables = sorted(load_rel_types(get_conn()))
         return "\n".join(tables) if tables else "No relationship types found."
     except Exception as e:
         return f"Could not list types: {e}"
 
 
 @mcp.tool()
+@threaded_tool()
 def inspect_person_schema() -> str:
     """Return a sample of people data."""
+    key = ("inspect_person_schema", (), _EPOCH)
+    if key in _READ_CACHE:
+        return _READ_CACHE[key]
+
     conn = get_conn()
     try:
-        result = conn.execute("MATCH (p:Person) RETURN p.name, p.data LIMIT 5")
-        output = []
-        while result.has_next():
-            row = result.get_next()
-            output.append(str(row))
-        return "\n".join(output) if output else "No people found."
+        df = conn.execute(
+            "MATCH (p:Person) RETURN p.name AS name, p.data AS data LIMIT 5"
+        ).get_as_df()
+        if df.empty:
+            return cache_read(key, "No people found.")
+        sample = [
+            {"name": name, "data": decode_stored_data(data)}
+            for name, data in df.itertuples(index=False, name=None)
+        ]
+        return cache_read(key, orjson.dumps(sample).decode())
     except Exception as e:
         return f"Error: {e}"
 
@@ -1,3 +1,4 @@
+import asyncio
 import pytest
 from unittest.mock import patch, MagicMock
 import json
@@ -12,60 +13,453 @@ sys.path.append(
 import server
 
 
-@pytest.fixture
-def mock_cozo():
-    with patch("server.requests.post") as mock_post:
-        yield mock_post
+@pytest.fixture(autouse=True)
+def empty_read_cache():
+    with patch("server._READ_CACHE", {}):
+        yield
 
 
-def test_add_person_success(mock_cozo):
-    # Setup mock response
-    mock_response = MagicMock()
-    mock_response.json.return_value = {"ok": True, "rows": []}
-    mock_response.raise_for_status.return_value = None
-    mock_cozo.return_value = mock_response
-
-    result = server.add_person("John Doe", '{"age": 30}')
+def test_add_person_success():
+    conn = MagicMock()
+    with patch("server.get_conn", return_value=conn), patch(
+        "server._PERSON_NAME_IS_KEY", True
+    ):
+        result = asyncio.run(server.add_person("John Doe", '{"age": 30}'))
 
     assert "Added person: John Doe" in result
-    assert mock_cozo.called
+    params = conn.execute.call_args.args[1]
+    assert params["name"] == "John Doe"
+    assert params["data"] == '{"age": 30}'
 
-    # Verify call arguments
-    args, kwargs = mock_cozo.call_args
-    payload = kwargs["json"]
-    assert "John Doe" in payload["params"]["name"]
-    assert payload["params"]["data"] == {"age": 30}
 
+def test_add_person_invalid_json():
+    with patch("server.get_conn") as mock_get_conn:
+        result = asyncio.run(server.add_person("John Doe", "{invalid json}"))
 
-def test_add_person_invalid_json(mock_cozo):
-    result = server.add_person("John Doe", "{invalid json}")
     assert "Error: properties must be a valid JSON string" in result
-    assert not mock_cozo.called
+    assert not mock_get_conn.called
 
 
-def test_list_relation_types(mock_cozo):
-    mock_response = MagicMock()
-    mock_response.json.return_value = {
-        "ok": True,
-        "rows": [["parent_child"], ["spouse"]],
-    }
-    mock_response.raise_for_status.return_value = None
-    mock_cozo.return_value = mock_response
+def test_get_conn_reuses_shared_connection():
+    with patch("server.kuzu") as mock_kuzu, patch("server._DB", None), patch(
+        "server._CONN", None
+    ):
+        first = server.get_conn()
+        second = server.get_conn()
+
+    assert first is second
+    mock_kuzu.Database.assert_called_once_with(server.DB_PATH)
+    mock_kuzu.Connection.assert_called_once()
+
+
+def test_add_person_duplicate_name():
+    conn = MagicMock()
+    conn.execute.side_effect = RuntimeError(
+        "Runtime exception: Found duplicated primary key value John Doe"
+    )
+    with patch("server.get_conn", return_value=conn), patch(
+        "server._PERSON_NAME_IS_KEY", True
+    ):
+        result = asyncio.run(server.add_person("John Doe", "{}"))
+
+    assert result == "Error: Person with name 'John Doe' already exists."
+    conn.execute.assert_called_once()
+
+
+def test_add_person_duplicate_name_without_name_key():
+    conn = MagicMock()
+    conn.execute.return_value.has_next.side_effect = [True, False]
+    conn.execute.return_value.get_next.return_value = ["John Doe"]
+    with patch("server.get_conn", return_value=conn), patch(
+        "server._PERSON_NAME_IS_KEY", False
+    ):
+        result = asyncio.run(server.add_person("John Doe", "{}"))
+
+    # Only the name lookup runs; nothing is created
+    assert result == "Error: Person with name 'John Doe' already exists."
+    conn.execute.assert_called_once()
+
+
+def test_person_name_is_key():
+    import pandas as pd
+
+    conn = MagicMock()
+    conn.execute.return_value.get_as_df.return_value = pd.DataFrame(
+        {"name": ["uuid", "name", "data"], "primary key": [True, False, False]}
+    )
+    assert not server.person_name_is_key(conn)
+
+    conn.execute.return_value.get_as_df.return_value = pd.DataFrame(
+        {"name": ["name", "uuid", "data"], "primary key": [True, False, False]}
+    )
+    assert server.person_name_is_key(conn)
+
+
+def test_add_persons_bulk_single_transaction():
+    conn = MagicMock()
+    with patch("server.get_txn_conn", return_value=conn), patch(
+        "server._PERSON_NAME_IS_KEY", True
+    ):
+        result = asyncio.run(
+            server.add_persons_bulk(
+                '[{"name": "Alice", "properties": {"job": "Dev"}}, {"name": "Bob"}]'
+            )
+        )
+
+    assert result == "Added 2 people."
+    queries = [c.args[0] for c in conn.execute.call_args_list]
+    assert queries[0] == "BEGIN TRANSACTION"
+    assert queries[-1] == "COMMIT"
+    assert len(queries) == 4
+    assert conn.execute.call_args_list[1].args[1]["data"] == '{"job":"Dev"}'
+
+
+def test_add_persons_bulk_invalid_json():
+    with patch("server.get_txn_conn") as mock_get_conn:
+        result = asyncio.run(server.add_persons_bulk('{"name": "Alice"}'))
+
+    assert "Error: people_json must be a JSON array" in result
+    assert not mock_get_conn.called
+
+
+def test_list_relation_types_filters_rel_tables():
+    import pandas as pd
+
+    conn = MagicMock()
+    conn.execute.return_value.get_as_df.return_value = pd.DataFrame(
+        {
+            "id": [0, 1, 2],
+            "name": ["Person", "Rule", "spouse"],
+            "type": ["NODE", "NODE", "REL"],
+        }
+    )
+    with patch("server.get_conn", return_value=conn), patch(
+        "server._REL_TYPES", set()
+    ), patch("server._REL_TYPES_LOADED", False):
+        assert asyncio.run(server.list_relation_types()) == "spouse"
+        server.ensure_rel_table(conn, "parent_child")
+        assert asyncio.run(server.list_relation_types()) == "parent_child\nspouse"
+
+    # One SHOW_TABLES plus the CREATE REL TABLE, no second catalog scan
+    assert conn.execute.call_count == 2
+
+
+def test_ensure_rel_table_memoizes_known_types():
+    conn = MagicMock()
+    with patch("server._REL_TYPES", set()):
+        assert server.ensure_rel_table(conn, "met-at") == "metat"
+        assert server.ensure_rel_table(conn, "met-at") == "metat"
+
+    conn.execute.assert_called_once()
+
+
+def test_ensure_rel_table_rejects_node_table_name():
+    import pandas as pd
+
+    show_tables = MagicMock()
+    show_tables.get_as_df.return_value = pd.DataFrame(
+        {"name": ["Person", "Rule", "spouse"], "type": ["NODE", "NODE", "REL"]}
+    )
+    conn = MagicMock()
+    conn.execute.side_effect = [
+        RuntimeError("Binder exception: Person already exists in catalog."),
+        show_tables,
+    ]
+    with patch("server.get_conn", return_value=conn), patch(
+        "server._REL_TYPES", set()
+    ), patch("server._REL_TYPES_LOADED", False):
+        result = asyncio.run(server.add_fact("Alice", "Bob", "Person"))
+        assert result == "Error: Invalid relationship type name."
+        assert asyncio.run(server.list_relation_types()) == "spouse"
+
+
+def test_list_rules_cached_until_rule_write():
+    import pandas as pd
+
+    conn = MagicMock()
+    conn.execute.return_value.get_as_df.return_value = pd.DataFrame(
+        {"name": ["siblings"], "description": ["Find siblings"]}
+    )
+    with patch("server.get_conn", return_value=conn):
+        assert asyncio.run(server.list_rules()) == "- siblings: Find siblings"
+        assert asyncio.run(server.list_rules()) == "- siblings: Find siblings"
+        assert conn.execute.call_count == 1
+
+        server.invalidate_reads(data=False, rules=True)
+        asyncio.run(server.list_rules())
+        assert conn.execute.call_count == 2
+
+
+def test_run_cypher_truncates_large_results():
+    result = MagicMock()
+    result.has_next.return_value = True
+    result.get_next.return_value = ["Alice", 30]
+    conn = MagicMock()
+    conn.execute.return_value = result
+    with patch("server.get_conn", return_value=conn), patch(
+        "server.MAX_CYPHER_ROWS", 3
+    ):
+        output = asyncio.run(
+            server.run_cypher("MATCH (p:Person) RETURN p.name, p.age")
+        )
+
+    lines = output.split("\n")
+    assert lines[:3] == ["['Alice', 30]"] * 3
+    assert lines[3] == "... truncated after 3 rows."
+
+
+def test_run_cypher_prepared_reuses_statement():
+    conn = MagicMock()
+    conn.execute.return_value.has_next.return_value = False
+    query = "MATCH (p:Person) WHERE p.name = $name RETURN p.data"
+    with patch("server.get_conn", return_value=conn), patch("server._STATEMENTS", {}):
+        asyncio.run(server.run_cypher_prepared(query, '{"name": "Alice"}'))
+        result = asyncio.run(server.run_cypher_prepared(query, '{"name": "Bob"}'))
+
+    assert result == "No results."
+    conn.prepare.assert_called_once_with(query)
+    assert conn.execute.call_args.args[1] == {"name": "Bob"}
+
+
+def test_run_cypher_prepared_invalid_params():
+    result = asyncio.run(server.run_cypher_prepared("RETURN $x", "[1, 2]"))
+    assert result == "Error: params_json must be a JSON object."
+
+
+def test_add_fact_single_query_on_success():
+    conn = MagicMock()
+    conn.execute.return_value.has_next.return_value = True
+    with patch("server.get_conn", return_value=conn), patch(
+        "server._REL_TYPES", {"spouse"}
+    ):
+        result = asyncio.run(server.add_fact("Alice", "Bob", "spouse"))
+
+    assert result == "Added fact: Alice --[spouse]--> Bob"
+    conn.execute.assert_called_once()
+
+
+def test_add_fact_reports_missing_person():
+    created = MagicMock()
+    created.has_next.return_value = False
+    found = MagicMock()
+    found.has_next.side_effect = [True, False]
+    found.get_next.return_value = ["Alice"]
+    conn = MagicMock()
+    conn.execute.side_effect = [created, found]
+    with patch("server.get_conn", return_value=conn), patch(
+        "server._REL_TYPES", {"spouse"}
+    ):
+        result = asyncio.run(server.add_fact("Alice", "Bob", "spouse"))
+
+    assert result == "Error: Person 'Bob' not found."
 
-    result = server.list_relation_types()
-    assert "Existing Relation Types: parent_child, spouse" in result
 
+def test_inspect_person_schema_returns_json_records():
+    import pandas as pd
 
-def test_inspect_person_schema(mock_cozo):
-    mock_response = MagicMock()
-    mock_response.json.return_value = {
-        "ok": True,
-        "rows": [["Alice", {"job": "Dev"}], ["Bob", {"job": "Designer"}]],
+    conn = MagicMock()
+    conn.execute.return_value.get_as_df.return_value = pd.DataFrame(
+        {"name": ["Alice", "Bob"], "data": ['{"job": "Dev"}', "{}"]}
+    )
+    with patch("server.get_conn", return_value=conn):
+        result = asyncio.run(server.inspect_person_schema())
+
+    assert json.loads(result) == [
+        {"name": "Alice", "data": {"job": "Dev"}},
+        {"name": "Bob", "data": {}},
+    ]
+
+
+def test_is_valid_properties():
+    assert server.is_valid_properties("{}")
+    assert server.is_valid_properties(' {"job": "Dev"} ')
+    assert not server.is_valid_properties("")
+    assert not server.is_valid_properties('"Dev"')
+    assert not server.is_valid_properties("{invalid json}")
+
+
+def test_add_person_fast_skips_validation():
+    conn = MagicMock()
+    with patch("server.get_conn", return_value=conn), patch(
+        "server._PERSON_NAME_IS_KEY", True
+    ), patch("server.orjson.loads") as mock_loads:
+        result = asyncio.run(server.add_person_fast("Alice", '{"job": "Dev"}'))
+
+    assert result.startswith("Added person: Alice")
+    assert not mock_loads.called
+    assert conn.execute.call_args.args[1]["data"] == '{"job": "Dev"}'
+
+
+def test_run_cypher_rejects_transaction_control():
+    with patch("server.get_conn") as mock_get_conn:
+        for query in ["BEGIN TRANSACTION", "match (n) return n; commit"]:
+            result = asyncio.run(server.run_cypher(query))
+            assert result == server.TRANSACTION_CONTROL_ERROR
+        result = asyncio.run(server.run_cypher_prepared("  rollback"))
+        assert result == server.TRANSACTION_CONTROL_ERROR
+
+    assert not mock_get_conn.called
+
+
+def test_add_persons_bulk_rolls_back_on_any_error():
+    conn = MagicMock()
+    conn.execute.side_effect = [None, ValueError("boom"), RuntimeError("no txn")]
+    with patch("server.get_txn_conn", return_value=conn), patch(
+        "server._PERSON_NAME_IS_KEY", True
+    ):
+        result = asyncio.run(server.add_persons_bulk('[{"name": "Alice"}]'))
+
+    assert result == "Error adding people, nothing added: boom"
+    assert conn.execute.call_args.args[0] == "ROLLBACK"
+
+
+def test_add_facts_bulk_checks_people_before_creating_tables():
+    conn = MagicMock()
+    conn.execute.return_value.has_next.side_effect = [True, False]
+    conn.execute.return_value.get_next.return_value = ["Alice"]
+    with patch("server.get_txn_conn", return_value=conn), patch(
+        "server._REL_TYPES", set()
+    ):
+        result = asyncio.run(
+            server.add_facts_bulk(
+                '[{"from_name": "Alice", "to_name": "Bob", "type": "new_type"}]'
+            )
+        )
+
+    assert result == "Error: Person(s) not found: Bob."
+    # Only the name lookup ran, no CREATE REL TABLE
+    conn.execute.assert_called_once()
+
+
+def test_add_facts_bulk_rejects_non_string_names():
+    with patch("server.get_txn_conn") as mock_get_conn:
+        result = asyncio.run(
+            server.add_facts_bulk('[{"from_name": 1, "to_name": "Bob", "type": "x"}]')
+        )
+
+    assert "Error: facts_json must be a JSON array of facts" in result
+    assert not mock_get_conn.called
+
+
+def test_run_cypher_clears_prepared_statements():
+    conn = MagicMock()
+    conn.execute.return_value.has_next.return_value = False
+    with patch("server.get_conn", return_value=conn), patch(
+        "server._STATEMENTS", {("conn", "CREATE ..."): MagicMock()}
+    ):
+        asyncio.run(server.run_cypher("ALTER TABLE Person ADD age INT64"))
+        assert server._STATEMENTS == {}
+
+
+def test_run_cypher_invalidates_after_the_query_runs():
+    epochs = []
+
+    def execute(query):
+        epochs.append(server._EPOCH)
+        result = MagicMock()
+        result.has_next.return_value = False
+        return result
+
+    conn = MagicMock()
+    conn.execute.side_effect = execute
+    before = server._EPOCH
+    with patch("server.get_conn", return_value=conn):
+        asyncio.run(server.run_cypher("MATCH (p:Person) SET p.data = '{}'"))
+
+    assert epochs == [before]
+    assert server._EPOCH == before + 1
+
+
+def test_load_rel_types_discards_catalog_read_during_change():
+    import pandas as pd
+
+    def show_tables(query):
+        # A raw query drops the catalog while SHOW_TABLES is running
+        server.forget_rel_types()
+        result = MagicMock()
+        result.get_as_df.return_value = pd.DataFrame(
+            {"name": ["spouse"], "type": ["REL"]}
+        )
+        return result
+
+    conn = MagicMock()
+    conn.execute.side_effect = show_tables
+    with patch("server._REL_TYPES", set()), patch("server._REL_TYPES_LOADED", False):
+        assert server.load_rel_types(conn) == {"spouse"}
+        assert not server._REL_TYPES_LOADED
+        assert server._REL_TYPES == set()
+
+
+def test_run_cypher_keeps_prepared_statements_without_ddl():
+    conn = MagicMock()
+    conn.execute.return_value.has_next.return_value = False
+    with patch("server.get_conn", return_value=conn), patch(
+        "server._STATEMENTS", {("conn", "CREATE ..."): MagicMock()}
+    ):
+        asyncio.run(server.run_cypher("MATCH (p:Person) RETURN p.name"))
+        assert len(server._STATEMENTS) == 1
+
+
+def test_add_person_fast_rejects_non_container():
+    with patch("server.get_conn") as mock_get_conn:
+        result = asyncio.run(server.add_person_fast("Alice", "Dev"))
+
+    assert result == "Error: properties must be a JSON object or array."
+    assert not mock_get_conn.called
+
+
+def test_inspect_person_schema_keeps_invalid_data_as_string():
+    import pandas as pd
+
+    conn = MagicMock()
+    conn.execute.return_value.get_as_df.return_value = pd.DataFrame(
+        {"name": ["Alice", "Bob"], "data": ["{job: Dev}", '"plain"']}
+    )
+    with patch("server.get_conn", return_value=conn):
+        result = asyncio.run(server.inspect_person_schema())
+
+    assert json.loads(result) == [
+        {"name": "Alice", "data": "{job: Dev}"},
+        {"name": "Bob", "data": '"plain"'},
+    ]
+
+
+def test_add_rule_passes_values_as_parameters():
+    conn = MagicMock()
+    conn.execute.return_value.has_next.return_value = False
+    with patch("server.get_conn", return_value=conn):
+        result = asyncio.run(
+            server.add_rule("sib's", "MATCH (a) RETURN a.name \\", "it's")
+        )
+
+    assert result == "Rule 'sib's' created."
+    assert conn.execute.call_args.args[1] == {
+        "name": "sib's",
+        "cypher": "MATCH (a) RETURN a.name \\",
+        "description": "it's",
     }
-    mock_response.raise_for_status.return_value = None
-    mock_cozo.return_value = mock_response
 
-    result = server.inspect_person_schema()
-    assert "Alice" in result
-    assert "Bob" in result
-    assert '{"job": "Dev"}' in result
+
+def test_add_persons_bulk_rejects_scalar_properties():
+    with patch("server.get_txn_conn") as mock_get_conn:
+        for people in [
+            '[{"name": "Q", "properties": "5"}]',
+            '[{"name": "Q", "properties": 5}]',
+        ]:
+            result = asyncio.run(server.add_persons_bulk(people))
+            assert "Error: people_json must be a JSON array of people" in result
+
+    assert not mock_get_conn.called
+
+
+def test_add_persons_bulk_failed_begin_returns_error():
+    conn = MagicMock()
+    conn.execute.side_effect = RuntimeError("Cannot start a new transaction")
+    with patch("server.get_txn_conn", return_value=conn), patch(
+        "server._PERSON_NAME_IS_KEY", True
+    ):
+        result = asyncio.run(server.add_persons_bulk('[{"name": "Alice"}]'))
+
+    assert result == (
+        "Error adding people, nothing added: Cannot start a new transaction"
+    )